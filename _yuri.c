@@ -0,0 +1,405 @@
+/*
+ * C implementations of Yuri's percent-encoding functions.
+ *
+ * Jon Parise <jon@indelible.org>
+ *
+ * These operate on byte strings only.  The yuri module falls back to its
+ * pure-Python implementations for everything else (and when this extension
+ * module isn't available).
+ */
+
+#include <Python.h>
+
+/* Use SSSE3 to classify sixteen bytes at a time on x86 compilers that let us
+ * enable it for individual functions.  We check for CPU support at runtime,
+ * so the extension still works on processors without it.  Older versions of
+ * clang lack the CPU detection builtins, so we check for them explicitly
+ * (rather than failing to build the extension at all). */
+#if defined(__GNUC__) && (defined(__x86_64__) || defined(__i386__))
+#  if defined(__clang__)
+#    if defined(__has_builtin)
+#      if __has_builtin(__builtin_cpu_supports) && \
+          __has_builtin(__builtin_cpu_init)
+#        define USE_SSSE3
+#      endif
+#    endif
+#  elif __GNUC__ > 4 || (__GNUC__ == 4 && __GNUC_MINOR__ >= 9)
+#    define USE_SSSE3
+#  endif
+#endif
+
+#ifdef USE_SSSE3
+#include <tmmintrin.h>
+#endif
+
+/* Flags for the entries of the safe_table lookup table.  SPACE marks the one
+ * byte that changes in an encoded query string without growing it (+). */
+#define PATH_SAFE   0x1
+#define QUERY_SAFE  0x2
+#define SPACE       0x4
+
+/* Indexed by byte; indicates whether a byte can be copied unchanged into an
+ * encoded path and/or query string.  (RFC 3986, Section 2.3) */
+static unsigned char safe_table[256];
+
+/* Indexed by byte; the byte's three-character percent-encoded form. */
+static char escape_table[256][3];
+
+/* Indexed by byte; the value of a hexadecimal digit or -1. */
+static signed char hex_values[256];
+
+#ifdef USE_SSSE3
+/* Indexed by a safe_table flag and then by a byte's low nibble; bit i is set
+ * if the byte with that low nibble and a high nibble of i is safe.  Only
+ * ASCII bytes (high nibbles 0-7) can be safe, so this fits in a byte. */
+static unsigned char safe_nibbles[QUERY_SAFE + 1][16];
+
+/* Whether the CPU supports SSSE3, and whether we're using it.  The latter
+ * can be turned off with set_ssse3() to test the portable code paths. */
+static int cpu_ssse3, have_ssse3;
+#endif
+
+static void
+init_tables(void)
+{
+    static const char hex_digits[] = "0123456789ABCDEF";
+    const char *unreserved = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+                             "abcdefghijklmnopqrstuvwxyz"
+                             "0123456789"
+                             "_.-~";
+    const char *c;
+    int i;
+
+    for (c = unreserved; *c; ++c)
+        safe_table[(unsigned char)*c] = PATH_SAFE | QUERY_SAFE;
+    safe_table['/'] |= PATH_SAFE;
+    safe_table[' '] |= SPACE;
+
+    for (i = 0; i < 256; ++i) {
+        escape_table[i][0] = '%';
+        escape_table[i][1] = hex_digits[i >> 4];
+        escape_table[i][2] = hex_digits[i & 0xF];
+    }
+
+    for (i = 0; i < 256; ++i)
+        hex_values[i] = -1;
+    for (i = 0; i < 10; ++i)
+        hex_values['0' + i] = i;
+    for (i = 0; i < 6; ++i)
+        hex_values['A' + i] = hex_values['a' + i] = 10 + i;
+
+#ifdef USE_SSSE3
+    for (i = 0; i < 128; ++i) {
+        if (safe_table[i] & PATH_SAFE)
+            safe_nibbles[PATH_SAFE][i & 0xF] |= 1 << (i >> 4);
+        if (safe_table[i] & QUERY_SAFE)
+            safe_nibbles[QUERY_SAFE][i & 0xF] |= 1 << (i >> 4);
+    }
+
+    __builtin_cpu_init();
+    cpu_ssse3 = have_ssse3 = __builtin_cpu_supports("ssse3");
+#endif
+}
+
+#ifdef USE_SSSE3
+/* Return a pointer to the first byte in [s, end) that isn't safe according
+ * to mask, or to the start of the final partial block of sixteen bytes if
+ * they're all safe.
+ *
+ * Each byte is classified with two table lookups (pshufb): one indexed by
+ * its low nibble, giving the set of safe high nibbles, and one indexed by
+ * its high nibble, giving that nibble's bit. */
+__attribute__((target("ssse3")))
+static const unsigned char *
+skip_safe_ssse3(const unsigned char *s, const unsigned char *end,
+                unsigned char mask)
+{
+    const __m128i nibbles = _mm_set1_epi8(0x0F);
+    const __m128i safe = _mm_loadu_si128((const __m128i *)safe_nibbles[mask]);
+    const __m128i bits = _mm_setr_epi8(1, 2, 4, 8, 16, 32, 64, -128,
+                                       0, 0, 0, 0, 0, 0, 0, 0);
+    __m128i v, lo, hi;
+    int unsafe;
+
+    while (end - s >= 16) {
+        v = _mm_loadu_si128((const __m128i *)s);
+        lo = _mm_shuffle_epi8(safe, _mm_and_si128(v, nibbles));
+        hi = _mm_shuffle_epi8(bits,
+                              _mm_and_si128(_mm_srli_epi16(v, 4), nibbles));
+        unsafe = _mm_movemask_epi8(
+            _mm_cmpeq_epi8(_mm_and_si128(lo, hi), _mm_setzero_si128()));
+        if (unsafe)
+            return s + __builtin_ctz(unsafe);
+        s += 16;
+    }
+    return s;
+}
+#endif
+
+#ifdef HAVE_UINT64_T
+/* SWAR ("SIMD within a register") helpers for classifying the eight bytes of
+ * a 64-bit word at once.  Each returns a word with the high bit of every
+ * matching byte set.  They are exact for each byte, without any false
+ * positives from carries, but only match bytes below 0x80.  (See "Bit
+ * Twiddling Hacks", http://graphics.stanford.edu/~seander/bithacks.html) */
+#define SWAR_ONES   ((PY_UINT64_T)0x0101010101010101ULL)
+#define SWAR_LOW7   (SWAR_ONES * 0x7F)
+#define SWAR_HIGH   (SWAR_ONES * 0x80)
+
+/* Bytes for which m < byte < n, where 0 <= m <= 127 and 0 <= n <= 128. */
+#define SWAR_BETWEEN(x, m, n) \
+    ((SWAR_ONES * (127 + (n)) - ((x) & SWAR_LOW7)) & ~(x) & \
+     (((x) & SWAR_LOW7) + SWAR_ONES * (127 - (m))) & SWAR_HIGH)
+
+/* Bytes equal to c. */
+#define SWAR_EQUALS(x, c) \
+    (~(((((x) ^ (SWAR_ONES * (c))) & SWAR_LOW7) + SWAR_LOW7) | \
+       ((x) ^ (SWAR_ONES * (c))) | SWAR_LOW7))
+
+/* Return true if all eight bytes of x are safe according to mask. */
+static int
+swar_safe(PY_UINT64_T x, unsigned char mask)
+{
+    PY_UINT64_T lower = x | (SWAR_ONES * 0x20);
+    PY_UINT64_T safe;
+
+    safe = SWAR_BETWEEN(lower, 'a' - 1, 'z' + 1) |
+           SWAR_BETWEEN(x, '0' - 1, '9' + 1) |
+           SWAR_EQUALS(x, '_') | SWAR_EQUALS(x, '~');
+
+    /* '-', '.' and '/' are adjacent, so one range test covers all three. */
+    if (mask & PATH_SAFE)
+        safe |= SWAR_BETWEEN(x, '-' - 1, '/' + 1);
+    else
+        safe |= SWAR_BETWEEN(x, '-' - 1, '.' + 1);
+
+    return safe == SWAR_HIGH;
+}
+#endif
+
+/* Return a pointer to the first byte in [s, end) that isn't safe according
+ * to mask, or end if they're all safe. */
+static const unsigned char *
+skip_safe(const unsigned char *s, const unsigned char *end, unsigned char mask)
+{
+#ifdef HAVE_UINT64_T
+    PY_UINT64_T x;
+#endif
+
+#ifdef USE_SSSE3
+    if (have_ssse3) {
+        s = skip_safe_ssse3(s, end, mask);
+        if (end - s >= 16)
+            return s;
+    }
+#endif
+
+#ifdef HAVE_UINT64_T
+    /* Skip ahead eight bytes at a time while we can.  The byte loop below
+     * finds the exact position within the first block that fails. */
+    while (end - s >= 8) {
+        memcpy(&x, s, 8);
+        if (!swar_safe(x, mask))
+            break;
+        s += 8;
+    }
+#endif
+    while (s < end && (safe_table[*s] & mask))
+        ++s;
+    return s;
+}
+
+/* Copy n bytes from src to dst, replacing +'s with spaces if plus is set.
+ * Short runs are copied inline, which is cheaper than calling memcpy() and
+ * memchr() for them. */
+static void
+copy_run(char *dst, const unsigned char *src, Py_ssize_t n, int plus)
+{
+    char *end = dst + n;
+
+    if (n < 16) {
+        while (dst < end) {
+            *dst = (plus && *src == '+') ? ' ' : (char)*src;
+            ++dst, ++src;
+        }
+        return;
+    }
+
+    memcpy(dst, src, n);
+    while (plus && (dst = memchr(dst, '+', end - dst)) != NULL)
+        *dst++ = ' ';
+}
+
+PyDoc_STRVAR(encode_doc,
+"encode(s, query=False) -> str\n\
+\n\
+Percent-encode a byte string.");
+
+static PyObject *
+encode(PyObject *self, PyObject *args)
+{
+    PyObject *string, *result;
+    const unsigned char *start, *s, *p, *end;
+    unsigned char mask, count_mask;
+    char *out;
+    Py_ssize_t length, escapes = 0;
+    PyObject *query_arg = NULL;
+    int query = 0;
+
+    if (!PyArg_ParseTuple(args, "S|O:encode", &string, &query_arg))
+        return NULL;
+    /* Like the pure-Python implementation, accept any value for query and
+     * test its truth. */
+    if (query_arg != NULL && (query = PyObject_IsTrue(query_arg)) < 0)
+        return NULL;
+
+    start = (const unsigned char *)PyString_AS_STRING(string);
+    length = PyString_GET_SIZE(string);
+    end = start + length;
+    mask = query ? QUERY_SAFE : PATH_SAFE;
+
+    /* Find the first byte that needs to change.  Most strings don't have
+     * one, and we can return those as-is. */
+    s = skip_safe(start, end, mask);
+    if (s == end) {
+        Py_INCREF(string);
+        return string;
+    }
+
+    /* Count the remaining bytes that need escaping so that we can allocate
+     * the result string in one step.  Spaces in query strings become +'s,
+     * which changes the string but not its length. */
+    count_mask = query ? (QUERY_SAFE | SPACE) : PATH_SAFE;
+    for (p = s; p < end; ++p)
+        escapes += !(safe_table[*p] & count_mask);
+    if (escapes > (PY_SSIZE_T_MAX - length) / 2) {
+        PyErr_NoMemory();
+        return NULL;
+    }
+
+    result = PyString_FromStringAndSize(NULL, length + escapes * 2);
+    if (result == NULL)
+        return NULL;
+    out = PyString_AS_STRING(result);
+
+    /* Copy the safe prefix in a single step, and then encode the rest of
+     * the string a byte at a time. */
+    memcpy(out, start, s - start);
+    out += s - start;
+    for (; s < end; ++s) {
+        if (safe_table[*s] & mask) {
+            *out++ = *s;
+        } else if (query && *s == ' ') {
+            *out++ = '+';
+        } else {
+            memcpy(out, escape_table[*s], 3);
+            out += 3;
+        }
+    }
+
+    return result;
+}
+
+PyDoc_STRVAR(decode_doc,
+"decode(s, query=False) -> str\n\
+\n\
+Decode a percent-encoded byte string.");
+
+static PyObject *
+decode(PyObject *self, PyObject *args)
+{
+    PyObject *string, *result;
+    const unsigned char *s, *end, *percent;
+    char *out, *start;
+    Py_ssize_t length, n;
+    PyObject *query_arg = NULL;
+    int query = 0;
+
+    if (!PyArg_ParseTuple(args, "S|O:decode", &string, &query_arg))
+        return NULL;
+    /* Like the pure-Python implementation, accept any value for query and
+     * test its truth. */
+    if (query_arg != NULL && (query = PyObject_IsTrue(query_arg)) < 0)
+        return NULL;
+
+    s = (const unsigned char *)PyString_AS_STRING(string);
+    length = PyString_GET_SIZE(string);
+    end = s + length;
+
+    /* Most strings don't need any decoding, so we can return them as-is. */
+    if (!memchr(s, '%', length) && !(query && memchr(s, '+', length))) {
+        Py_INCREF(string);
+        return string;
+    }
+
+    /* The decoded string is never longer than the original.  We start with a
+     * string of the same length and shrink it once we're done. */
+    result = PyString_FromStringAndSize(NULL, length);
+    if (result == NULL)
+        return NULL;
+    start = out = PyString_AS_STRING(result);
+
+    /* Copy everything up to the next '%' in a single step (memchr() is
+     * usually vectorized by the C library), and then decode its escape. */
+    while (s < end) {
+        percent = (*s == '%') ? s : memchr(s, '%', end - s);
+        n = (percent ? percent : end) - s;
+        copy_run(out, s, n, query);
+        out += n;
+        s += n;
+        if (percent == NULL)
+            break;
+        if (end - s >= 3 && hex_values[s[1]] >= 0 && hex_values[s[2]] >= 0) {
+            *out++ = (char)((hex_values[s[1]] << 4) | hex_values[s[2]]);
+            s += 3;
+        } else {
+            *out++ = *s++;
+        }
+    }
+
+    if (_PyString_Resize(&result, out - start) < 0)
+        return NULL;
+    return result;
+}
+
+PyDoc_STRVAR(set_ssse3_doc,
+"set_ssse3(enabled) -> bool\n\
+\n\
+Enable or disable the SSSE3 code paths (when the CPU supports them) and\n\
+return whether they were previously enabled.  This is intended for testing\n\
+the portable code paths on processors that support SSSE3.");
+
+static PyObject *
+set_ssse3(PyObject *self, PyObject *enabled)
+{
+#ifdef USE_SSSE3
+    int previous = have_ssse3;
+    int value = PyObject_IsTrue(enabled);
+
+    if (value < 0)
+        return NULL;
+    have_ssse3 = value && cpu_ssse3;
+    return PyBool_FromLong(previous);
+#else
+    if (PyObject_IsTrue(enabled) < 0)
+        return NULL;
+    Py_RETURN_FALSE;
+#endif
+}
+
+static PyMethodDef methods[] = {
+    {"encode", encode, METH_VARARGS, encode_doc},
+    {"decode", decode, METH_VARARGS, decode_doc},
+    {"set_ssse3", set_ssse3, METH_O, set_ssse3_doc},
+    {NULL, NULL, 0, NULL}
+};
+
+PyDoc_STRVAR(module_doc,
+"C implementations of Yuri's percent-encoding functions.");
+
+PyMODINIT_FUNC
+init_yuri(void)
+{
+    init_tables();
+    Py_InitModule3("_yuri", methods, module_doc);
+}
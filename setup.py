@@ -1,6 +1,26 @@
 #!/usr/bin/env python
 
-from distutils.core import setup
+from distutils.command.build_ext import build_ext
+from distutils.core import setup, Extension
+from distutils.errors import CCompilerError, DistutilsError
+
+class optional_build_ext(build_ext):
+    """Build our C extension module, but don't fail if it can't be built.
+
+    The yuri module falls back to its pure-Python implementations when the
+    extension module isn't available.
+    """
+    def run(self):
+        try:
+            build_ext.run(self)
+        except (CCompilerError, DistutilsError), e:
+            self.warn('skipping C extension modules: %s' % e)
+
+    def build_extension(self, ext):
+        try:
+            build_ext.build_extension(self, ext)
+        except (CCompilerError, DistutilsError), e:
+            self.warn('skipping %s: %s' % (ext.name, e))
 
 version = __import__('yuri').__version__
 
@@ -16,4 +36,6 @@ setup(
                    'Operating System :: OS Independent',
                    'Programming Language :: Python'],
     py_modules = ['yuri'],
+    ext_modules = [Extension('_yuri', ['_yuri.c'])],
+    cmdclass = {'build_ext': optional_build_ext},
 )
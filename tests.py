@@ -23,6 +23,13 @@ class EncodingTests(unittest.TestCase):
         self.assertEqual(yuri.encode('/', query=True), '%2F')
         self.assertEqual(yuri.encode(' ', query=True), '+')
 
+    def test_unicode(self):
+        self.assertEqual(yuri.encode(u'abc/def'), u'abc/def')
+        self.assertEqual(yuri.encode(u'abc/def', query=True), u'abc%2Fdef')
+        self.assertEqual(yuri.encode(u'two words', query=True), u'two+words')
+        self.assertEqual(yuri.encode(u'br\xfcckner'), 'br%C3%BCckner')
+        self.assertEqual(yuri.encode(u'\u3042', query=True), '%E3%81%82')
+
     def test_basic_encoding(self):
         should_encode = [chr(num) for num in range(32)] # For 0x00 - 0x1F
         should_encode.append('<>#%"{}|\^[]`')
@@ -98,7 +105,89 @@ class DecodingTests(unittest.TestCase):
 
     def test_unicode(self):
         r = yuri.decode(u'br%C3%BCckner_sapporo_20050930.doc')
-        self.assertEqual(r, u'br\xc3\xbcckner_sapporo_20050930.doc')
+        self.assertEqual(r, u'br\xfcckner_sapporo_20050930.doc')
+        r = yuri.decode(u'br\xfcckner+%E3%81%82', query=True)
+        self.assertEqual(r, u'br\xfcckner \u3042')
+        r = yuri.decode(u'invalid%E9utf-8')
+        self.assertEqual(r, u'invalid\ufffdutf-8')
+
+@unittest.skipIf(yuri._yuri is None, 'C extension module is not available')
+class ExtensionTests(unittest.TestCase):
+
+    def pure(self, func, *args, **kwargs):
+        # Call one of yuri's functions using its pure-Python implementation.
+        extension, yuri._yuri = yuri._yuri, None
+        try:
+            return func(*args, **kwargs)
+        finally:
+            yuri._yuri = extension
+
+    def test_encode(self):
+        given = ''.join(chr(num) for num in range(256))
+        for query in (False, True, None, 0, 1, '', 'yes', [], [1]):
+            expected = self.pure(yuri.encode, given, query=query)
+            result = yuri.encode(given, query=query)
+            self.assertEqual(expected, result)
+        self.assertRaises(TypeError, yuri.encode, None)
+
+    def compare_encode(self, tests):
+        for given in tests:
+            for query in (False, True):
+                expected = self.pure(yuri.encode, given, query=query)
+                result = yuri.encode(given, query=query)
+                self.assertEqual(expected, result)
+
+    def encode_tests(self):
+        # Every byte value, at every position relative to the block
+        # boundaries, both after a run of safe bytes and at the end of one.
+        # These exercise the bulk scanning and copying paths.
+        safe = (yuri.unreserved_characters * 2)[:40]
+        for length in (1, 7, 8, 9, 15, 16, 17, 31, 32, 33, 40):
+            prefix = safe[:length]
+            for num in range(256):
+                char = chr(num)
+                yield prefix + char
+                yield prefix + char + prefix
+                yield char + prefix
+
+        # The bytes on either side of the ranges that the SWAR checks test
+        # (including the upper case letters' neighbors, which are folded
+        # into lower case), at each position of an eight-byte word.
+        for char in '@[\\`{,:/-.09AZaz_~^\x7f\x80\xc0\xe0':
+            for position in range(16):
+                yield 'abcdefghijklmnop'[:position] + char + 'qrstuvwxyzABCDEF'
+
+        # Dense and sparse escapes after a long run of safe bytes.
+        prefix = 'abcdefghijklmnopqrstuvwxyz0123456789'
+        yield prefix + ' /?#[]@!$&\'()*+,;=%'
+        yield prefix + ' a/b c?d' * 10
+        yield prefix + '/' + prefix + ' ' + prefix + '\xff'
+        yield ''.join(chr(num) for num in range(256)) * 2
+
+    def test_encode_runs(self):
+        # Use the SSSE3 code paths if the processor supports them.
+        enabled = yuri._yuri.set_ssse3(True)
+        try:
+            self.compare_encode(self.encode_tests())
+        finally:
+            yuri._yuri.set_ssse3(enabled)
+
+    def test_encode_runs_without_ssse3(self):
+        # Exercise the portable code paths on processors that support SSSE3.
+        enabled = yuri._yuri.set_ssse3(False)
+        try:
+            self.compare_encode(self.encode_tests())
+        finally:
+            yuri._yuri.set_ssse3(enabled)
+
+    def test_decode(self):
+        tests = ['', 'abc', 'a+b', '%', '%x', '%xab', '%Ab%eA', 'a%20b+c%']
+        tests.append(''.join(hexed(chr(num)) for num in range(256)))
+        for given in tests:
+            for query in (False, True, None, 0, 1, '', 'yes', [], [1]):
+                expected = self.pure(yuri.decode, given, query=query)
+                result = yuri.decode(given, query=query)
+                self.assertEqual(expected, result)
 
 class ParsingTests(unittest.TestCase):
 
@@ -158,6 +247,73 @@ class ParsingTests(unittest.TestCase):
             result = yuri.parse(uri)
             self.assertEqual(result, expected)
 
+    def test_edge_cases(self):
+        tests = [
+            ('',                    (None, None, None, None, '', None, None)),
+            ('localhost:8080',      ('localhost', None, None, None, '8080',
+                                     None, None)),
+            ('a/b:c',               (None, None, None, None, 'a/b:c',
+                                     None, None)),
+            ('//@host',             (None, None, '@host', None, '', None,
+                                     None)),
+            ('//a@b@c/d',           (None, 'a', 'b@c', None, '/d', None,
+                                     None)),
+            ('//:80',               (None, None, None, '80', '', None, None)),
+            ('http://h:abc/x',      ('http', None, 'h', None, ':abc/x',
+                                     None, None)),
+            ('http://h:80abc/x',    ('http', None, 'h', '80', 'abc/x',
+                                     None, None)),
+            ('http://h/p?q?r#f#g',  ('http', None, 'h', None, '/p', 'q?r',
+                                     'f#g')),
+            ('http://h/#f\ng',      ('http', None, 'h', None, '/', None, 'f')),
+            ('http://@h',           ('http', None, '@h', None, '', None,
+                                     None)),
+            ('https://a@b@c/d',     ('https', 'a', 'b@c', None, '/d', None,
+                                     None)),
+            ('http://:80',          ('http', None, None, '80', '', None,
+                                     None)),
+            ('https://',            ('https', None, None, None, '', None,
+                                     None)),
+            ('http:foo',            ('http', None, None, None, 'foo', None,
+                                     None)),
+            ('HTTP://h/x',          ('HTTP', None, 'h', None, '/x', None,
+                                     None)),
+            ('https://[::1]:80/x',  ('https', None, '[', None, '::1]:80/x',
+                                     None, None)),
+            ('httpx://h/',          ('httpx', None, 'h', None, '/', None,
+                                     None)),
+        ]
+
+        for uri, expected in tests:
+            self.assertEqual(yuri.split(uri), expected)
+
+    def test_split(self):
+        uri = 'http://jon@www.example.com:1000/path;p?query#fragment'
+        result = yuri.split(uri)
+        self.assertEqual(result, ('http', 'jon', 'www.example.com', '1000',
+                                  '/path;p', 'query', 'fragment'))
+        self.assertEqual(result._asdict(), yuri.parse(uri))
+
+    def test_parse_many(self):
+        uris = ['http://www.python.org/', 'file:///tmp/junk.txt', '',
+                'http://www.python.org/']
+        expected = [yuri.parse(uri) for uri in uris]
+        self.assertEqual(yuri.parse_many(uris), expected)
+        self.assertEqual(yuri.parse_many(iter(uris)), expected)
+        self.assertEqual(yuri.parse_many([]), [])
+
+    def test_cache(self):
+        yuri.clear_cache()
+        uri = 'http://www.python.org/'
+        result = yuri.parse(uri)
+        self.assertEqual(len(yuri.parse_cache), 1)
+        result['host'] = 'www.example.com'
+        self.assertEqual(yuri.parse(uri)['host'], 'www.python.org')
+        self.assertIs(type(yuri.parse(unicode(uri))['host']), unicode)
+        self.assertEqual(len(yuri.parse_cache), 2)
+        yuri.clear_cache()
+        self.assertFalse(yuri.parse_cache)
+
 class QueryDictTests(unittest.TestCase):
 
     def test_parsing(self):
@@ -172,12 +328,36 @@ class QueryDictTests(unittest.TestCase):
             ('&a=b',        {'a': 'b'}),
             ('a=a+b&b=b+c', {'a': 'a b', 'b': 'b c'}),
             ('a=1&a=2',     {'a': ['1', '2']}),
+            ('a=b=c',       {'a': 'b=c'}),
+            ('a=%26%3D%3B', {'a': '&=;'}),
+            ('a+b=c%2Bd',   {'a b': 'c+d'}),
         ]
 
         for given, expected in tests:
             d = yuri.QueryDict(given)
             self.assertEqual(d, expected)
 
+    def test_str(self):
+        tests = [
+            ('',                ''),
+            ('a=1',             'a=1'),
+            ('a=10&b=two+words', 'a=10&b=two+words'),
+            ('a=1&a=2&b=3',     'a=1&a=2&b=3'),
+        ]
+
+        for given, expected in tests:
+            d = yuri.QueryDict(given)
+            self.assertEqual(str(d), expected)
+
+    def test_equality(self):
+        self.assertEqual(yuri.QueryDict('a=1'), yuri.QueryDict('a=1'))
+        self.assertNotEqual(yuri.QueryDict('a=1'), yuri.QueryDict('a=2'))
+        self.assertNotEqual(yuri.QueryDict('a=1'), {'a': ['1']})
+        self.assertEqual(yuri.QueryDict('a=1&b=2'), {'b': '2', 'a': '1'})
+        # Like OrderedDict, equality between QueryDicts is order-sensitive.
+        self.assertNotEqual(yuri.QueryDict('a=1&b=2'),
+                            yuri.QueryDict('b=2&a=1'))
+
     def test_dict(self):
         d = yuri.QueryDict('a=1')
         self.assertIn('a', d)
@@ -190,6 +370,12 @@ class QueryDictTests(unittest.TestCase):
         d.clear()
         self.assertFalse(d)
 
+        d = yuri.QueryDict('a=1&b=2&b=3')
+        self.assertEqual(dict(d), {'a': '1', 'b': ['2', '3']})
+        self.assertEqual(dict(**d), {'a': '1', 'b': ['2', '3']})
+        self.assertEqual(d.items(), [('a', '1'), ('b', ['2', '3'])])
+        self.assertEqual(d.copy(), d)
+
     def test_get(self):
         d = yuri.QueryDict('a=1')
         self.assertEqual(d.get('a'), '1')
@@ -203,11 +389,62 @@ class QueryDictTests(unittest.TestCase):
         d = yuri.QueryDict('a=1')
         d.add('a', '2')
         self.assertListEqual(d['a'], ['1', '2'])
+        d.add('a', '3')
+        self.assertListEqual(d['a'], ['1', '2', '3'])
 
     def test_remove(self):
         d = yuri.QueryDict('a=1&a=2')
         d.remove('a', '1')
         self.assertEqual(d['a'], '2')
+        self.assertEqual(dict(d), {'a': '2'})
+
+class URITests(unittest.TestCase):
+
+    def test_slots(self):
+        uri = yuri.URI.parse('http://www.example.com:8080/path')
+        self.assertFalse(hasattr(uri, '__dict__'))
+        self.assertRaises(AttributeError, setattr, uri, 'unknown', 1)
+        uri.port = '80'
+        self.assertEqual(uri.port, 80)
+
+    def test_port(self):
+        uri = yuri.URI()
+        for port in (0, 80, 65535, 80L, '8080', 8080.0):
+            uri.port = port
+            self.assertEqual(uri.port, int(port))
+            self.assertIs(type(uri.port), int)
+        for port in (-1, -65536, 65536, 1 << 32, '-80', '99999'):
+            self.assertRaises(ValueError, setattr, uri, 'port', port)
+        uri.port = None
+        self.assertIsNone(uri.port)
+
+    def test_domain(self):
+        tests = [
+            ('localhost',               'localhost'),
+            ('127.0.0.1',               '127.0.0.1'),
+            ('www.example.com',         'example.com'),
+            ('www.example.com.',        'example.com.'),
+            ('www.example.co.uk',       'example.co.uk'),
+            ('www.example.museum',      'example.museum'),
+            ('www.example.example',     'www.example.example'),
+            ('www.-example.com',        'example.com'),
+            ('www.e.com',               'www.e.com'),
+            ('x_.co.uk',                'co.uk'),
+            ('a' * 70 + '.com',         'a' * 64 + '.com'),
+            ('a.b.c.d.e.f.g.example.co.uk', 'example.co.uk'),
+            ('ab.......',               'ab.......'),
+        ]
+
+        for host, expected in tests:
+            self.assertEqual(yuri.URI(host=host).domain, expected)
+
+    def test_domain_cache(self):
+        uri = yuri.URI(host='www.example.com')
+        self.assertEqual(uri.domain, 'example.com')
+        uri.host = 'www.example.org'
+        self.assertEqual(uri.domain, 'example.org')
+        uri.host = None
+        self.assertEqual(uri.domain, None)
 
 def load_tests(loader, tests, ignore):
     optionflags = doctest.NORMALIZE_WHITESPACE
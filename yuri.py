@@ -13,9 +13,9 @@ Yuri attempts to conform to the following standards:
 
 __version__ = '0.9.0'
 
-import binascii
 import collections
 import re
+import string
 
 # We prefer to use OrderedDict, but if it's not available (< Python 2.7), we
 # fall back to the normal dict implementation.  In the latter case, some of
@@ -26,13 +26,21 @@ try:
 except ImportError:
     OrderedDict = dict
 
-__all__ = ['parse', 'encode', 'decode', 'QueryDict', 'URI']
+# Our optional C extension module provides faster implementations of the
+# percent-encoding functions for byte strings.
+try:
+    import _yuri
+except ImportError:
+    _yuri = None
+
+__all__ = ['parse', 'parse_many', 'split', 'encode', 'decode', 'QueryDict',
+           'URI']
 
 # A regular expression that splits a well-formed URI reference into its
 # components (adapted from RFC 3986, Appendix B).
 uri_re = re.compile(r"""^
         (?:(?P<scheme>[^:/?#]+):)?          # scheme:
-        (?://(                              # //authority
+        (?://(?:                            # //authority
             (?:(?P<userinfo>[^/?#@]+)@)?    # userinfo@
             (?:(?P<host>[^/?#:]+))?         # host
             (?::(?P<port>[0-9]+))?          # :port
@@ -42,12 +50,29 @@ uri_re = re.compile(r"""^
         (?:\#(?P<fragment>.*))?             # #fragment
         """,
         re.VERBOSE)
+uri_match = uri_re.match
+
+# Most URIs are http or https URIs, so split() tries this specialization of
+# uri_re first.  It skips the general scheme matching and the optional
+# authority group, and its groups are identical to uri_re's whenever it
+# matches.
+http_re = re.compile(r"""^
+        (?P<scheme>https?):                 # scheme:
+        //(?:(?P<userinfo>[^/?#@]+)@)?      # //userinfo@
+        (?:(?P<host>[^/?#:]+))?             # host
+        (?::(?P<port>[0-9]+))?              # :port
+        (?P<path>[^?#]*)                    # path
+        (?:\?(?P<query>[^#]*))?             # ?query
+        (?:\#(?P<fragment>.*))?             # #fragment
+        """,
+        re.VERBOSE)
+http_match = http_re.match
 
-# A regular expression that implements a simple (and naive) heuristic for
-# extracting the domain name portion of a fully-qualified hostname.  It looks
-# for the last domain component that is followed by 2-to-6 characters of valid
-# TLD-like characters (e.g. '.com', '.co.uk', '.info').
-domain_re = re.compile(".*?([a-z0-9][a-z0-9\-]{1,63}\.[a-z\.]{2,6})$", re.I)
+# The characters that can appear in a domain name label and in the TLD-like
+# suffix that follows it.  These drive the URI.domain heuristic.
+tld_characters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ' \
+                 'abcdefghijklmnopqrstuvwxyz'
+label_characters = tld_characters + '0123456789-'
 
 # Unreserved characters are allowed in a URI but should not be %-encoded.
 # (RFC 3986, Section 2.3)
@@ -56,6 +81,65 @@ unreserved_characters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ' \
                         '0123456789' \
                         '_.-~'
 
+# The characters that never need to be encoded in a path.
+path_characters = unreserved_characters + '/'
+
+# Lookup tables that map every byte to its encoded form in a path or a query
+# string.  Spaces are encoded as +'s in query strings.
+path_escapes = {}
+query_escapes = {}
+for i in range(256):
+    char = chr(i)
+    escape = '%%%02X' % i
+    path_escapes[char] = char if char in path_characters else escape
+    query_escapes[char] = char if char in unreserved_characters else escape
+query_escapes[' '] = '+'
+del i, char, escape
+
+# A translation table that converts a query string's +'s back into spaces.
+plus_table = string.maketrans('+', ' ')
+
+# A lookup table that maps every two-digit hexadecimal string (in any mix of
+# upper and lower case) to its decoded byte.
+hex_bytes = {}
+for i in range(256):
+    for pair in ('%X%X', '%x%x', '%X%x', '%x%X'):
+        hex_bytes[pair % divmod(i, 16)] = chr(i)
+del i, pair
+
+# A named tuple of a URI's major components, as returned by split().
+URIComponents = collections.namedtuple('URIComponents',
+        'scheme userinfo host port path query fragment')
+
+# split() caches its results because the same URIs tend to be parsed again
+# and again.  Like the urlparse module's cache, it is simply cleared whenever
+# it fills up.
+MAX_CACHE_SIZE = 4096
+parse_cache = {}
+
+def clear_cache():
+    """Clear the split() and parse() cache."""
+    parse_cache.clear()
+
+def split(uri):
+    """Split a URI string into a URIComponents tuple of its major components.
+
+    >>> split('http://www.example.com/path?query')
+    URIComponents(scheme='http', userinfo=None, host='www.example.com',
+                  port=None, path='/path', query='query', fragment=None)
+    """
+    key = (uri, type(uri))
+    components = parse_cache.get(key)
+    if components is None:
+        # Every part of uri_re is optional, so it matches any string.  Its
+        # groups are in the same order as URIComponents' fields.
+        match = http_match(uri) or uri_match(uri)
+        components = URIComponents._make(match.groups())
+        if len(parse_cache) >= MAX_CACHE_SIZE:
+            clear_cache()
+        parse_cache[key] = components
+    return components
+
 def parse(uri):
     """Parse a URI string into a dictionary of its major components.
 
@@ -73,10 +157,38 @@ def parse(uri):
     scheme:     http
     userinfo:   jon
     """
-    match = uri_re.match(uri)
-    if match is not None:
-        return match.groupdict()
-    return {}
+    # Building the dictionary from literal keys is much faster than zipping
+    # the tuple with URIComponents._fields.
+    scheme, userinfo, host, port, path, query, fragment = split(uri)
+    return {'scheme': scheme, 'userinfo': userinfo, 'host': host,
+            'port': port, 'path': path, 'query': query, 'fragment': fragment}
+
+def parse_many(uris):
+    """Parse an iterable of URI strings into a list of component dictionaries.
+
+    This is equivalent to (but faster than) calling parse() on each string.
+
+    >>> [d['host'] for d in parse_many(['http://a.com/', 'http://b.com/'])]
+    ['a.com', 'b.com']
+    """
+    results = []
+    append = results.append
+    cached = parse_cache.get
+    for uri in uris:
+        components = cached((uri, type(uri))) or split(uri)
+        scheme, userinfo, host, port, path, query, fragment = components
+        append({'scheme': scheme, 'userinfo': userinfo, 'host': host,
+                'port': port, 'path': path, 'query': query,
+                'fragment': fragment})
+    return results
+
+def unplus(s):
+    """Convert a query string's +'s back into spaces."""
+    # str.translate() is faster than str.replace() for byte strings, but
+    # unicode.translate() is much slower than unicode.replace().
+    if isinstance(s, unicode):
+        return s.replace('+', ' ')
+    return s.translate(plus_table)
 
 def encode(s, query=False):
     """Percent-encode a string.
@@ -94,19 +206,25 @@ def encode(s, query=False):
     Unreserved characters are never encoded:
     >>> encode(unreserved_characters)
     'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_.-~'
+
+    Percent-encoding operates on bytes, so unicode strings are encoded as
+    UTF-8 (RFC 3986, Section 2.5):
+    >>> encode(u'br\\xfcckner')
+    'br%C3%BCckner'
     """
-    safe = unreserved_characters
-    safe += ' ' if query else '/'
-    encoded = ''
-    for char in s:
-        ordinal = ord(char)
-        if ordinal < 128 and char in safe:
-            encoded += char
-        else:
-            encoded += '%{:02X}'.format(ordinal)
-    if query:
-        encoded = encoded.replace(' ', '+')
-    return encoded
+    if isinstance(s, unicode):
+        s = s.encode('utf-8')
+    if _yuri is not None:
+        return _yuri.encode(s, query)
+    if not isinstance(s, str):
+        raise TypeError('encode() argument 1 must be string, not %s' %
+                        type(s).__name__)
+    # Strings that only contain unreserved characters (and /'s, for paths)
+    # don't need to be encoded at all, which is common for query fields.
+    if not s.strip(unreserved_characters if query else path_characters):
+        return s
+    table = query_escapes if query else path_escapes
+    return ''.join(map(table.__getitem__, s))
 
 def decode(s, query=False):
     """Decode a percent-encoded string.
@@ -120,26 +238,38 @@ def decode(s, query=False):
     'two words'
     >>> decode('two+words', query=True)
     'two words'
+
+    Percent-encoding operates on bytes, so unicode strings are decoded as
+    UTF-8 (RFC 3986, Section 2.5):
+    >>> decode(u'br%C3%BCckner')
+    u'br\\xfcckner'
     """
+    if isinstance(s, unicode):
+        if '%' not in s:
+            return unplus(s) if query else s
+        return decode(s.encode('utf-8'), query).decode('utf-8', 'replace')
+    if _yuri is not None:
+        return _yuri.decode(s, query)
     if query:
-        s = s.replace('+', ' ')
+        s = s.translate(plus_table)
+    # Most strings don't contain any percent-encoded characters, so we can
+    # avoid all of the work below and return them as-is.
+    if '%' not in s:
+        return s
     # Split the string into chunks at % boundaries.  The first two characters
     # of each chunk after the first should be hex digits in need of decoding.
     chunks = s.split('%')
-    decoded = chunks[0]
+    decoded = [chunks[0]]
+    append = decoded.append
+    lookup = hex_bytes.get
     for chunk in chunks[1:]:
-        if len(chunk) < 2:
-            decoded += '%' + chunk
-            continue
-        try:
-            decoded += binascii.unhexlify(chunk[:2])
-            decoded += chunk[2:]
-        except TypeError:
-            decoded += '%' + chunk
-        except UnicodeDecodeError:
-            decoded += unichr(int(chunk[:2], 16))
-            decoded += chunk[2:]
-    return decoded
+        char = lookup(chunk[:2])
+        if char is None:
+            append('%' + chunk)
+        else:
+            append(char)
+            append(chunk[2:])
+    return ''.join(decoded)
 
 class QueryDict(OrderedDict):
     """A QueryDict manages a collection of query fields.
@@ -150,6 +280,10 @@ class QueryDict(OrderedDict):
 
     It always store unencoded strings.  Strings are properly encoded once the
     QueryDict's URI string representation is request (via the __str__ method).
+
+    A field with a single value stores that value directly.  A field with
+    multiple values stores them as a list, which later values are appended
+    to in place.
     """
     def __init__(self, query=None):
         """Initialize a QueryDict.
@@ -195,11 +329,17 @@ class QueryDict(OrderedDict):
         'a=1&b=2'
         """
         pairs = []
+        append = pairs.append
+        # Bind the names used in the loop locally; local lookups are cheaper
+        # than global and attribute lookups.
+        quote = encode
         for name, values in self.iteritems():
-            name = encode(name, query=True)
-            for value in values:
-                value = encode(value, query=True)
-                pairs.append('%s=%s' % (name, value))
+            prefix = quote(name, True) + '='
+            if type(values) is list:
+                for value in values:
+                    append(prefix + quote(value, True))
+            else:
+                append(prefix + quote(values, True))
         return '&'.join(pairs)
 
     def __contains__(self, name):
@@ -219,6 +359,22 @@ class QueryDict(OrderedDict):
     def get(self, name, default=None):
         return OrderedDict.get(self, name.lower(), default)
 
+    def copy(self):
+        """Return a copy of this QueryDict.
+
+        >>> q = QueryDict('a=1&a=2'); c = q.copy(); c.add('a', '3'); q
+        {'a': ['1', '2']}
+        """
+        # OrderedDict.copy() would pass us to our own constructor, which
+        # expects a query string.  Multiple values are copied into new lists
+        # so that the two QueryDicts can be changed independently.
+        query = QueryDict()
+        for name, values in self.iteritems():
+            if type(values) is list:
+                values = list(values)
+            OrderedDict.__setitem__(query, name, values)
+        return query
+
     def update(self, *args, **kwargs):
         # Make sure we use our custom __setitem__.
         for k, v in OrderedDict(*args, **kwargs).iteritems():
@@ -234,15 +390,18 @@ class QueryDict(OrderedDict):
         >>> q.add('a', '2'); q
         {'a': ['1', '2']}
         """
+        # We normalize the name once and then use the base class's methods
+        # directly to avoid redundantly normalizing it again.
         name = name.lower()
-        if name in self:
-            values = self[name]
-            if type(values) is not list:
-                values = [values]
+        values = OrderedDict.get(self, name)
+        if values is None:
+            OrderedDict.__setitem__(self, name, str(value))
+        elif type(values) is list:
+            # Multiple values are already a list, so there's nothing to
+            # write back.
             values.append(str(value))
-            OrderedDict.__setitem__(self, name, values)
         else:
-            OrderedDict.__setitem__(self, name, str(value))
+            OrderedDict.__setitem__(self, name, [values, str(value)])
 
     def remove(self, name, value):
         """Remove a single value for the given field name.
@@ -264,34 +423,81 @@ class QueryDict(OrderedDict):
         KeyError: 'a'
         """
         name = name.lower()
-        values = self[name]
+        values = OrderedDict.__getitem__(self, name)
         if type(values) is list:
             values.remove(value)
             if len(values) == 1:
-                self[name] = values[0]
-            elif not values:
-                del self[name]
+                OrderedDict.__setitem__(self, name, values[0])
         elif value == values:
-            del self[name]
+            OrderedDict.__delitem__(self, name)
 
     def parse(self, query):
         """Parse the given query string and add its fields."""
-        for pair in re.split('[&;]', query):
-            try:
-                name, value = pair.split('=')
-            except ValueError:
-                # Skip completely empty items.
-                if not pair:
-                    continue
-                # Allow names without values.
-                name, value = pair, ''
-            name = decode(name, query=True)
-            value = decode(value, query=True)
-            self.add(name, value)
+        # +'s can be decoded across the entire query string at once because
+        # they never decode to separators.  Percent-encoded characters can
+        # (e.g. '%26'), so those must still be decoded field-by-field.
+        query = unplus(query)
+        unquote = decode
+        add = self.add
+        # Splitting on a single separator is much faster than splitting on a
+        # regular expression, so we first convert semicolons to ampersands.
+        for pair in query.replace(';', '&').split('&'):
+            # Skip completely empty items.
+            if not pair:
+                continue
+            # Only the first '=' separates the name from the value.  Names
+            # without values (and without an '=') are allowed.
+            name, _, value = pair.partition('=')
+            if '%' in name:
+                name = unquote(name)
+            if '%' in value:
+                value = unquote(value)
+            add(name, value)
+
+def find_domain(host):
+    """Get just the domain portion of a host name.  See URI.domain."""
+    # We use a simple (and naive) heuristic to extract the domain name
+    # portion of the host string: look for the last domain label that is
+    # followed by 2-to-6 characters of TLD-like labels (e.g. '.com',
+    # '.co.uk', '.info').  A more correct approach would involve
+    # maintaining a list of all registered top-level domains plus DNS SOA
+    # queries for each subdomain portion of the host, but both of those
+    # approaches are expensive and beyond our current intent.
+    if not host:
+        return host
+    # The suffix is at most six characters long, so it can't span more
+    # than seven labels.  Only the last eight labels (the suffix plus its
+    # preceding label) can matter; the first item may hold the rest.
+    labels = host.rsplit('.', 8)
+    # Walk backwards over the trailing labels that could form the suffix.
+    first = len(labels)
+    length = -1
+    while first > 1:
+        label = labels[first - 1]
+        length += len(label) + 1
+        if length > 6 or label.strip(tld_characters):
+            break
+        first -= 1
+    # Prefer the longest suffix that is preceded by a usable label.  Only
+    # the label's trailing run of valid characters (up to 64 of them,
+    # starting with a letter or digit) is considered part of the domain.
+    for i in xrange(first, len(labels)):
+        suffix = '.'.join(labels[i:])
+        if len(suffix) < 2:
+            break
+        label = labels[i - 1]
+        label = label[len(label.rstrip(label_characters)):][-64:]
+        label = label.lstrip('-')
+        if len(label) >= 2:
+            return label + '.' + suffix
+    return host
 
 class URI(object):
     """The URI class represents a Uniform Resource Identifier."""
 
+    __slots__ = ('scheme', 'userinfo', '_host', '_port', 'path', '_query',
+                 'fragment', '_domain')
+
     def __init__(self, scheme=None, userinfo=None, host=None, port=None,
             path=None, query=None, fragment=None):
         self.scheme = scheme
@@ -299,7 +505,7 @@ class URI(object):
         self.host = host
         self.port = port
         self.path = path
-        self.query = query if type(query) is QueryDict else QueryDict(query)
+        self.query = query
         self.fragment = fragment
 
     @classmethod
@@ -310,13 +516,12 @@ class URI(object):
         <URI scheme='http', userinfo=None, host='www.example.com',
          port=8080, path='/path', query={}, fragment=None>
         """
-        components = parse(uri)
-        return cls(**components)
+        return cls(*split(uri))
 
     def __repr__(self):
-        return '<URI scheme=%(scheme)r, userinfo=%(userinfo)r, ' \
-               'host=%(host)r, port=%(port)r, path=%(path)r, ' \
-               'query=%(query)r, fragment=%(fragment)r>' % self.__dict__
+        return '<URI scheme=%r, userinfo=%r, host=%r, port=%r, path=%r, ' \
+               'query=%r, fragment=%r>' % (self.scheme, self.userinfo,
+               self._host, self._port, self.path, self._query, self.fragment)
 
     def __str__(self):
         """Return this object's corresponding URI reference string.
@@ -332,24 +537,36 @@ class URI(object):
         >>> str(URI(scheme='http', host='www.example.com', query='a=1'))
         'http://www.example.com?a=1'
         """
-        uri = ''
+        # Read the slots behind the host, port and query properties directly,
+        # and only once each, to avoid the descriptor calls.
+        userinfo = self.userinfo
+        host = self._host
+        port = self._port
+        query = self._query
+        parts = []
+        append = parts.append
         if self.scheme:
-            uri += self.scheme + ':'
-        if self.userinfo or self.host or self.port:
-            uri += '//'
-            if self.userinfo:
-                uri += self.userinfo + '@'
-            if self.host:
-                uri += self.host
-            if self.port:
-                uri += ':' + str(self.port)
+            append(self.scheme)
+            append(':')
+        if userinfo or host or port:
+            append('//')
+            if userinfo:
+                append(userinfo)
+                append('@')
+            if host:
+                append(host)
+            if port:
+                append(':')
+                append(str(port))
         if self.path:
-            uri += self.path
-        if self.query:
-            uri += '?' + str(self.query)
+            append(self.path)
+        if query:
+            append('?')
+            append(str(query))
         if self.fragment:
-            uri += '#' + self.fragment
-        return uri
+            append('#')
+            append(self.fragment)
+        return ''.join(parts)
 
     @property
     def domain(self):
@@ -364,15 +581,21 @@ class URI(object):
         >>> URI(host='www.example.co.uk').domain
         'example.co.uk'
         """
-        # Just use our regular expression in our attempt to extract the domain
-        # name portion of the host string.  A more correct approach would
-        # involve maintaining a list of all registered top-level domains plus
-        # DNS SOA queries for each subdomain portion of the host, but both of
-        # those approaches are expensive and beyond our current intent.
-        match = domain_re.match(self.host)
-        if match is not None:
-            return match.group(1)
-        return self.host
+        # The domain only depends on the host, so we compute it once and
+        # keep it until the host changes.
+        if self._domain is None:
+            self._domain = find_domain(self._host)
+        return self._domain
+
+    @property
+    def host(self):
+        """Access the URI's host component."""
+        return self._host
+
+    @host.setter
+    def host(self, host):
+        self._host = host
+        self._domain = None
 
     @property
     def port(self):
@@ -390,17 +613,38 @@ class URI(object):
             ...
         ValueError: -100 is outside the valid port range (0-65535)
         """
-        return self.__dict__.get('port')
+        return self._port
 
     @port.setter
     def port(self, port):
         if port is not None:
             # We always store the port as a number internally.
-            port = int(port)
-            if port < 0 or port > 65535:
+            if type(port) is not int:
+                port = int(port)
+            # Any bit above the low 16 (including a negative number's sign
+            # bits) puts the port outside of the valid range.
+            if port & ~0xFFFF:
                 raise ValueError('%d is outside the valid port range '
                                  '(0-65535)' % port)
-        self.__dict__['port'] = port
+        self._port = port
+
+    @property
+    def query(self):
+        """Access the URI's query component.
+
+        The query is always stored as a QueryDict.  Query strings are parsed
+        when they are assigned.
+
+        >>> uri = URI(); uri.query = 'a=1&b=2'; uri.query
+        {'a': '1', 'b': '2'}
+        """
+        return self._query
+
+    @query.setter
+    def query(self, query):
+        if type(query) is not QueryDict:
+            query = QueryDict(query)
+        self._query = query
 
 if __name__ == '__main__':
     import doctest